@@ -1,10 +1,16 @@
+import asyncio
+import functools
 import logging
-import json
 import os
+import re
+import sys
 from datetime import datetime
-from typing import Annotated, Optional, List, Dict, Any
-from dataclasses import dataclass, asdict, field
+from types import MappingProxyType
+from typing import Annotated, Optional, Any
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, field
 
+import orjson
 from dotenv import load_dotenv
 from pydantic import Field
 from livekit.agents import (
@@ -31,38 +37,56 @@ load_dotenv(".env.local")
 # ======================================================
 
 CATALOG_FILE = "catalog.json"
-ORDER_FOLDER = "orders"
+# Resolved once at import so saves don't depend on (or recompute) the working directory
+ORDER_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "orders"))
+_INGREDIENTS_PREFIX = "ingredients for "
+
+# Characters after which a match counts as the start of a word for fuzzy scoring
+_BOUNDARY_CHARS = " -_("
+_WHITESPACE_RE = re.compile(r"\s+")
+_PUNCTUATION_RE = re.compile(r"[.,!?;:\"]")
+_LEADING_ARTICLE_RE = re.compile(r"^(?:a|an|the|some)\s+")
+
+# Slotted dataclasses drop the per-instance __dict__ (slots= needs Python 3.10+)
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
 # Simple Recipe Mapping for 'Intelligent Bundling'
-# Format: Dish Name -> List of (Item Name, Quantity)
-RECIPES = {
-    "peanut butter sandwich": [
+# Format: Dish Name -> Tuple of (Item Name, Quantity); read-only after load
+RECIPES = MappingProxyType({
+    "peanut butter sandwich": (
         ("Whole Wheat Bread", 1),
         ("Peanut Butter", 1),
-    ],
-    "pasta for two": [
+    ),
+    "pasta for two": (
         ("Spaghetti Pasta", 1),
         ("Tomato Sauce", 1),
-    ],
-    "basic breakfast": [
+    ),
+    "basic breakfast": (
         ("Eggs (dozen)", 1),
         ("Milk (gallon)", 1),
         ("Bacon (pack)", 1),
-    ],
-}
+    ),
+})
 
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class CatalogItem:
     """Schema for an item in the catalog."""
     name: str
     category: str
     price: float
     units: str
-    tags: List[str] = field(default_factory=list)
+    tags: list[str] = field(default_factory=list)
+    # Lowercased forms used by lookups, computed once per item
+    name_lower: str = field(init=False, repr=False, compare=False)
+    tags_blob: str = field(init=False, repr=False, compare=False)
 
-def load_catalog() -> Dict[str, CatalogItem]:
-    """Loads the catalog from JSON and indexes by name."""
+    def __post_init__(self):
+        self.name_lower = self.name.lower()
+        self.tags_blob = " ".join(self.tags).lower()
+
+def load_catalog() -> Mapping[str, CatalogItem]:
+    """Loads the catalog from JSON and indexes by name as a read-only mapping."""
     path = os.path.join(os.path.dirname(__file__), CATALOG_FILE)
     if not os.path.exists(path):
         # Create a sample catalog if it doesn't exist
@@ -78,25 +102,226 @@ def load_catalog() -> Dict[str, CatalogItem]:
             {"name": "Bacon (pack)", "category": "Groceries", "price": 8.00, "units": "pack", "tags": ["meat"]},
             {"name": "Cereal (box)", "category": "Groceries", "price": 5.50, "units": "box", "tags": ["breakfast"]},
         ]
-        with open(path, "w", encoding='utf-8') as f:
-            json.dump(sample_catalog, f, indent=4)
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(sample_catalog, option=orjson.OPT_INDENT_2))
         print(f"✅ Catalog seeded at {CATALOG_FILE}")
 
-    with open(path, "r", encoding='utf-8') as f:
-        data = json.load(f)
+    with open(path, "rb") as f:
+        data = orjson.loads(f.read())
     
     # Index by lowercased name for easy lookup
-    catalog = {item["name"].lower(): CatalogItem(**item) for item in data}
-    return catalog
+    items = (CatalogItem(**item) for item in data)
+    catalog = {cat_item.name_lower: cat_item for cat_item in items}
+    return MappingProxyType(catalog)
 
 # Initialize Catalog on load
 CATALOG = load_catalog()
 
+def normalize_recipes() -> Mapping[str, tuple[tuple[CatalogItem, int], ...]]:
+    """Lowercases recipe names and resolves each ingredient to its catalog item once."""
+    recipes = {}
+    for recipe_name, ingredients in RECIPES.items():
+        resolved = []
+        for item_name, default_qty in ingredients:
+            cat_item = CATALOG.get(item_name.lower())
+            if cat_item is not None:
+                resolved.append((cat_item, default_qty))
+        recipes[recipe_name.lower()] = tuple(resolved)
+    return MappingProxyType(recipes)
+
+# Recipes with ingredients already resolved against the catalog
+RECIPES_NORM = normalize_recipes()
+
+def index_item_recipes() -> Mapping[str, tuple[str, ...]]:
+    """Inverts RECIPES_NORM: catalog key -> names of the recipes that use the item."""
+    item_recipes: dict[str, list[str]] = {}
+    for recipe_key, ingredients in RECIPES_NORM.items():
+        for cat_item, _ in ingredients:
+            item_recipes.setdefault(cat_item.name_lower, []).append(recipe_key)
+    return MappingProxyType({key: tuple(names) for key, names in item_recipes.items()})
+
+# Reverse recipe index for suggesting the rest of a bundle
+_ITEM_TO_RECIPES = index_item_recipes()
+
+# Lowercased "name tags..." blobs searched by the fuzzy fallback, built once
+_SEARCH_BLOBS: tuple[tuple[str, CatalogItem], ...] = tuple(
+    (f"{item.name_lower} {item.tags_blob}", item) for item in CATALOG.values()
+)
+
+def _compile_phrases(phrases: Iterable[str]) -> Optional[re.Pattern]:
+    """Compiles literal phrases into one word-bounded alternation, or None if empty."""
+    if not phrases:
+        return None
+    # Longest first, so the alternation prefers 'peanut butter' over 'butter'
+    alternation = "|".join(re.escape(p) for p in sorted(phrases, key=len, reverse=True))
+    return re.compile(rf"(?<!\w)(?:{alternation})(?!\w)")
+
+def build_phrase_scanner() -> tuple[Optional[re.Pattern], Mapping[str, CatalogItem]]:
+    """
+    Compiles every catalog name into one regex so a name inside a longer utterance
+    ('two jars of tomato sauce please') is found by one search. `re` still tries the
+    alternation at each position, which is cheap at this catalog size. Tags are left
+    out: inside a phrase they describe something else ('dairy free milk').
+    """
+    return _compile_phrases(CATALOG), CATALOG
+
+_PHRASE_RE, _PHRASES = build_phrase_scanner()
+
+def find_phrase(text: str) -> Optional[CatalogItem]:
+    """Returns the item for the longest catalog name mentioned in `text`."""
+    if _PHRASE_RE is None:
+        return None
+    best = ""
+    for match in _PHRASE_RE.finditer(text):
+        if len(match.group()) > len(best):
+            best = match.group()
+    return _PHRASES[best] if best else None
+
+def _normalize(name: str) -> str:
+    """Lowercases, strips sentence punctuation and collapses whitespace."""
+    name = _PUNCTUATION_RE.sub("", name.lower())
+    return _WHITESPACE_RE.sub(" ", name).strip()
+
+def _singularize(name: str) -> str:
+    """Naively drops a plural 's' ('eggs' -> 'egg'); 'ss' endings are left alone."""
+    if name.endswith("s") and not name.endswith("ss"):
+        return name[:-1]
+    return name
+
+_RECIPE_RE = _compile_phrases(RECIPES_NORM)
+
+def resolve_recipe(name: str) -> Optional[str]:
+    """
+    Returns the recipe key a request names, or None. With the 'ingredients for'
+    prefix the recipe may sit inside extra words ('ingredients for a spaghetti pasta
+    for two'); without it the request must be the recipe name itself, so an item
+    like 'basic breakfast cereal' is not turned into the whole bundle.
+    """
+    normalized = _normalize(name)
+    key = _LEADING_ARTICLE_RE.sub("", normalized.removeprefix(_INGREDIENTS_PREFIX))
+    if key in RECIPES_NORM:
+        return key
+    if not normalized.startswith(_INGREDIENTS_PREFIX) or _RECIPE_RE is None:
+        return None
+    match = _RECIPE_RE.search(key)
+    return match.group() if match else None
+
+def _find_word_start(candidate: str, char: str, start: int) -> int:
+    """Returns the first index >= `start` where `char` begins a word, or -1."""
+    pos = candidate.find(char, start)
+    while pos > 0 and candidate[pos - 1] not in _BOUNDARY_CHARS:
+        pos = candidate.find(char, pos + 1)
+    return pos
+
+def _ends_word(candidate: str, pos: int) -> bool:
+    """True when a match ending just before `pos` covers the rest of its word (bar a plural 's')."""
+    if pos < len(candidate) and candidate[pos] == "s":
+        pos += 1
+    return pos == len(candidate) or not candidate[pos].isalnum()
+
+def _score_from(pattern: str, candidate: str, start: int) -> int:
+    """Scores one alignment of `pattern` whose first character matches at `start`."""
+    runs = []  # (length, ends_word) for each run of consecutive matches
+    run = 1
+    pos = start + 1
+    need_word_start = False
+    for char in pattern[1:]:
+        if char == " ":
+            need_word_start = True
+            continue
+        if not need_word_start and pos < len(candidate) and candidate[pos] == char:
+            run += 1
+        else:
+            runs.append((run, _ends_word(candidate, pos)))
+            pos = _find_word_start(candidate, char, pos)
+            if pos < 0:
+                return -1
+            run = 1
+        pos += 1
+        need_word_start = False
+    runs.append((run, _ends_word(candidate, pos)))
+
+    lengths = [length for length, _ in runs]
+    if max(lengths) == 1:
+        # Initials: need at least two to mean anything
+        if len(runs) < 2:
+            return -1
+    elif min(lengths) == 1 or any(length < 4 and not ends_word for length, ends_word in runs):
+        # Mixed initials and prefixes, or a short prefix that isn't a whole word
+        return -1
+
+    # Fewer, longer runs and whole-word matches rank higher
+    score = 4 * sum(lengths) - len(runs)
+    score += 2 * sum(1 for _, ends_word in runs if ends_word)
+    return score
+
+def fuzzy_score(pattern: str, candidate: str) -> int:
+    """
+    Scores `pattern` against `candidate`, so 'pb' finds 'peanut butter'.
+    Each pattern character must start a word or continue the run matched just before
+    it, and the pattern must read either as initials ('pb') or as word prefixes
+    ('spag pasta') rather than a mix ('tea' -> 'to eat'). A prefix shorter than four
+    characters must be the whole word, so 'pea' does not match 'peanut'.
+    Returns -1 when `pattern` does not match.
+    """
+    pattern = pattern.strip()
+    if not pattern:
+        return -1
+
+    # One linear pass per word that could start the match
+    best = -1
+    start = _find_word_start(candidate, pattern[0], 0)
+    while start >= 0:
+        best = max(best, _score_from(pattern, candidate, start))
+        start = _find_word_start(candidate, pattern[0], start + 1)
+    return best
+
+def fuzzy_find(pattern: str) -> Optional[CatalogItem]:
+    """Returns the best-scoring catalog item for `pattern`, or None if nothing matches."""
+    best_item = None
+    best_score = -1
+    for blob, item in _SEARCH_BLOBS:
+        score = fuzzy_score(pattern, blob)
+        if score > best_score:
+            best_item, best_score = item, score
+    return best_item
+
+@functools.lru_cache(maxsize=512)
+def _resolve_item(pattern: str) -> Optional[str]:
+    """
+    Maps a spoken item name onto its catalog key, or None if nothing matches.
+    Safe to memoize because the catalog never changes after load.
+    """
+    # Try the input as normalized first, then de-pluralised as a fallback
+    normalized_key = _normalize(pattern)
+    keys = [normalized_key]
+    singular_key = _singularize(normalized_key)
+    if singular_key != normalized_key:
+        keys.append(singular_key)
+
+    # Cheap normalization resolves most near-misses without a fuzzy scan
+    for key in keys:
+        if key in CATALOG:
+            return key
+
+    # A catalog name spoken inside a longer phrase
+    for key in keys:
+        match = find_phrase(key)
+        if match:
+            return match.name_lower
+
+    # Try a fuzzy search on the catalog
+    for key in keys:
+        match = fuzzy_find(key)
+        if match:
+            return match.name_lower
+    return None
+
 # ======================================================
 # 🧠 2. STATE MANAGEMENT (Cart)
 # ======================================================
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class CartItem:
     """An item currently in the user's cart."""
     name: str
@@ -104,12 +329,38 @@ class CartItem:
     price: float  # Price per unit
     notes: str = ""
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class OrderingState:
     """Holds the current state of the ordering session."""
     customer_name: Optional[str] = None
     customer_address: Optional[str] = None
-    cart: List[CartItem] = field(default_factory=list)
+    # Keyed by lowercased item name; dicts keep insertion order for summaries.
+    # Read it freely, but change it only through add_item() and clear_cart(),
+    # which keep `cart_total` in step.
+    cart: dict[str, CartItem] = field(default_factory=dict)
+    cart_total: float = 0.0
+
+    def add_item(self, cat_item: CatalogItem, quantity: int, notes: str = "") -> CartItem:
+        """Adds units of a catalog item, merging into its existing cart line if present."""
+        cart_key = cat_item.name_lower
+        cart_item = self.cart.get(cart_key)
+        if cart_item:
+            cart_item.quantity += quantity
+        else:
+            cart_item = CartItem(
+                name=cat_item.name,
+                quantity=quantity,
+                price=cat_item.price,
+                notes=notes,
+            )
+            self.cart[cart_key] = cart_item
+        self.cart_total += quantity * cat_item.price
+        return cart_item
+
+    def clear_cart(self) -> None:
+        """Empties the cart and resets the running total."""
+        self.cart = {}
+        self.cart_total = 0.0
 
     def get_cart_summary(self) -> str:
         """Returns a formatted summary of the cart."""
@@ -117,18 +368,32 @@ class OrderingState:
             return "Your cart is currently empty."
         
         summary = ["Current Cart:"]
-        total = 0.0
-        for item in self.cart:
+        for item in self.cart.values():
             line_total = item.quantity * item.price
-            total += line_total
             summary.append(f"- {item.quantity} x {item.name} (${item.price:.2f} each) -> ${line_total:.2f}")
         
-        summary.append(f"TOTAL: ${total:.2f}")
+        summary.append(f"TOTAL: ${self.cart_total:.2f}")
         return "\n".join(summary)
     
     def calculate_total(self) -> float:
-        """Calculates the current total price of the cart."""
-        return sum(item.quantity * item.price for item in self.cart)
+        """Returns the current total price of the cart."""
+        return self.cart_total
+
+def recipe_suggestion(state: OrderingState, item_key: str) -> str:
+    """
+    Describes the recipes that use `item_key` and still have ingredients missing
+    from the cart, naming those ingredients. Returns "" when nothing is missing.
+    """
+    suggestions = []
+    for recipe_key in _ITEM_TO_RECIPES.get(item_key, ()):
+        missing = [
+            cat_item.name
+            for cat_item, _ in RECIPES_NORM[recipe_key]
+            if cat_item.name_lower not in state.cart
+        ]
+        if missing:
+            suggestions.append(f"'{recipe_key}' (missing: {', '.join(missing)})")
+    return "; ".join(suggestions)
 
 # ======================================================
 # 🛠️ 3. ORDERING AGENT TOOLS
@@ -148,60 +413,43 @@ async def add_to_cart(
     state = ctx.userdata
     
     # 1. Check for Recipe Match (Intelligent Bundling)
-    recipe_key = item_or_recipe_name.lower().replace("ingredients for ", "").strip()
-    if recipe_key in RECIPES:
+    recipe_key = resolve_recipe(item_or_recipe_name)
+    if recipe_key is not None:
         items_added = []
-        for item_name, default_qty in RECIPES[recipe_key]:
+        for cat_item, default_qty in RECIPES_NORM[recipe_key]:
             # Scale quantity based on user request (e.g., "pasta for two people" might scale ingredients)
             final_qty = default_qty * quantity 
-
-            if item_name.lower() in CATALOG:
-                cat_item = CATALOG[item_name.lower()]
-                
-                # Check if item is already in the cart
-                existing_item = next((i for i in state.cart if i.name.lower() == item_name.lower()), None)
-
-                if existing_item:
-                    existing_item.quantity += final_qty
-                else:
-                    new_item = CartItem(
-                        name=cat_item.name,
-                        quantity=final_qty,
-                        price=cat_item.price,
-                        notes=notes if notes else "",
-                    )
-                    state.cart.append(new_item)
-                items_added.append(f"{final_qty} x {cat_item.name}")
+            state.add_item(cat_item, final_qty, notes if notes else "")
+            items_added.append(f"{final_qty} x {cat_item.name}")
         
         return f"SUCCESS: Added ingredients for '{recipe_key}' to the cart: {', '.join(items_added)}."
 
+    # A recipe we don't know must not quietly become one of its ingredients
+    if _normalize(item_or_recipe_name).startswith(_INGREDIENTS_PREFIX):
+        return (f"ERROR: I don't have a recipe for '{item_or_recipe_name}'. "
+                f"Available recipes: {', '.join(RECIPES_NORM)}.")
+
     # 2. Handle Single Item
     item_key = item_or_recipe_name.lower()
     if item_key not in CATALOG:
-        # Try a fuzzy search on the catalog
-        match = next((i for k, i in CATALOG.items() if item_key in k or item_key in " ".join(i.tags).lower()), None)
-        if match:
-            item_key = match.name.lower()
-        else:
+        item_key = _resolve_item(item_key)
+        if item_key is None:
             return f"ERROR: I could not find '{item_or_recipe_name}' in the catalog. Please try a different item or check the spelling."
 
     cat_item = CATALOG[item_key]
     
     # Check if item is already in the cart
-    existing_item = next((i for i in state.cart if i.name.lower() == item_key), None)
-
-    if existing_item:
-        existing_item.quantity += quantity
-        return f"SUCCESS: Increased quantity of {cat_item.name} to {existing_item.quantity}."
-    else:
-        new_item = CartItem(
-            name=cat_item.name,
-            quantity=quantity,
-            price=cat_item.price,
-            notes=notes if notes else "",
-        )
-        state.cart.append(new_item)
-        return f"SUCCESS: Added {quantity} x {cat_item.name} to the cart."
+    already_in_cart = item_key in state.cart
+    cart_item = state.add_item(cat_item, quantity, notes if notes else "")
+
+    if already_in_cart:
+        return f"SUCCESS: Increased quantity of {cat_item.name} to {cart_item.quantity}."
+
+    result = f"SUCCESS: Added {quantity} x {cat_item.name} to the cart."
+    suggestion = recipe_suggestion(state, item_key)
+    if suggestion:
+        result += f" SUGGESTION: {cat_item.name} is part of {suggestion}; offer to add the missing items."
+    return result
 
 @function_tool
 async def list_cart_contents(ctx: RunContext[OrderingState]) -> str:
@@ -211,6 +459,12 @@ async def list_cart_contents(ctx: RunContext[OrderingState]) -> str:
     """
     return ctx.userdata.get_cart_summary()
 
+def _write_order_sync(order_object: dict[str, Any], filename: str) -> None:
+    """Writes an order file; run in a worker thread to keep disk I/O off the event loop."""
+    # Compact output: order files are machine-consumed, pipe through `jq .` to read them
+    with open(filename, "wb") as f:
+        f.write(orjson.dumps(order_object))
+
 @function_tool
 async def place_order(
     ctx: RunContext[OrderingState],
@@ -226,9 +480,10 @@ async def place_order(
         return "ERROR: The cart is empty. Please add items before placing an order."
 
     # 1. Prepare Order Data
-    order_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    now = datetime.now()
+    order_id = now.strftime("%Y%m%d%H%M%S")
+
     order_total = state.calculate_total()
-    
     order_items = [
         {
             "item_name": item.name,
@@ -237,12 +492,12 @@ async def place_order(
             "line_total": round(item.quantity * item.price, 2),
             "notes": item.notes,
         }
-        for item in state.cart
+        for item in state.cart.values()
     ]
 
     order_object = {
         "order_id": order_id,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": now.isoformat(),
         "customer_info": {
             "name": customer_name,
             "address": customer_address,
@@ -251,18 +506,16 @@ async def place_order(
         "order_total": round(order_total, 2)
     }
 
-    # 2. Save to JSON file
-    os.makedirs(ORDER_FOLDER, exist_ok=True)
+    # 2. Save to JSON file (ORDER_FOLDER is created once in prewarm)
     filename = os.path.join(ORDER_FOLDER, f"order_{order_id}.json")
     
     try:
-        with open(filename, "w", encoding='utf-8') as f:
-            json.dump(order_object, f, indent=4)
+        await asyncio.to_thread(_write_order_sync, order_object, filename)
         
         print(f"✅ ORDER PLACED: Saved to {filename}")
 
         # 3. Clear cart after successful placement
-        state.cart = [] 
+        state.clear_cart()
         state.customer_name = customer_name
         state.customer_address = customer_address
         
@@ -293,6 +546,7 @@ class OrderingAgent(Agent):
                 - Use the `add_to_cart` tool for every item requested, including quantity and any notes (like 'gluten-free').
                 - **CRITICAL:** If the user asks for "ingredients for X", use the full phrase as the `item_or_recipe_name` in the `add_to_cart` tool.
                 - After a tool call returns SUCCESS, verbally confirm the item(s) added and the current item count.
+                - If the result includes a SUGGESTION, briefly offer it once. If the user agrees, add only the named missing items, one `add_to_cart` call each.
 
             3. **CART MANAGEMENT:**
                 - When the user asks "What's in my cart?", use the `list_cart_contents` tool.
@@ -316,6 +570,24 @@ class OrderingAgent(Agent):
 
 def prewarm(proc: JobProcess):
     proc.userdata["vad"] = silero.VAD.load()
+    os.makedirs(ORDER_FOLDER, exist_ok=True)
+
+def build_session(userdata: OrderingState, vad: Any) -> AgentSession:
+    """Wires the STT/LLM/TTS pipeline shared by every session this worker serves."""
+    return AgentSession(
+        stt=deepgram.STT(model="nova-3"),
+        llm=google.LLM(model="gemini-2.5-flash"),
+        tts=murf.TTS(
+            voice="en-US-marcus",
+            style="Conversational",
+            text_pacing=True,
+        ),
+        # Built per session: the turn detector binds to the current job's inference
+        # executor, so it cannot be created once in prewarm like the VAD.
+        turn_detection=MultilingualModel(),
+        vad=vad,
+        userdata=userdata,
+    )
 
 async def entrypoint(ctx: JobContext):
     ctx.log_context_fields = {"room": ctx.room.name}
@@ -327,18 +599,7 @@ async def entrypoint(ctx: JobContext):
     userdata = OrderingState()
 
     # 2. Setup Agent
-    session = AgentSession(
-        stt=deepgram.STT(model="nova-3"),
-        llm=google.LLM(model="gemini-2.5-flash"), 
-        tts=murf.TTS(
-            voice="en-US-marcus", 
-            style="Conversational",        
-            text_pacing=True,
-        ),
-        turn_detection=MultilingualModel(),
-        vad=ctx.proc.userdata["vad"],
-        userdata=userdata,
-    )
+    session = build_session(userdata, ctx.proc.userdata["vad"])
     
     # 3. Start
     await session.start(
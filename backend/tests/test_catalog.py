@@ -0,0 +1,164 @@
+import pytest
+
+from agent import (
+    CATALOG,
+    OrderingState,
+    _normalize,
+    _resolve_item,
+    find_phrase,
+    fuzzy_find,
+    fuzzy_score,
+    recipe_suggestion,
+    resolve_recipe,
+)
+
+
+@pytest.mark.parametrize(
+    ("pattern", "expected"),
+    [
+        ("pb", "peanut butter"),
+        ("milks", "milk (gallon)"),
+        ("spag pasta", "spaghetti pasta"),
+        ("wheat bread", "whole wheat bread"),
+        ("dairy", "milk (gallon)"),
+    ],
+)
+def test_resolves_abbreviations_and_near_misses(pattern: str, expected: str) -> None:
+    """Initials, word prefixes, plurals and tags resolve to the right catalog key."""
+    assert _resolve_item(pattern) == expected
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    ["tea", "cake", "oil", "bagel", "beans", "oats", "crab", "pear", "peas", "xyzzy"],
+)
+def test_rejects_items_the_catalog_does_not_stock(pattern: str) -> None:
+    """Words that only match as a scattered subsequence must not add an unrelated item."""
+    assert _resolve_item(pattern) is None
+
+
+def test_fuzzy_score_requires_word_starts_or_runs() -> None:
+    """Initials and word prefixes match; scattered or mixed alignments do not."""
+    assert fuzzy_score("pb", "peanut butter protein") > 0
+    assert fuzzy_score("spag", "spaghetti pasta carb") > 0
+    # 't' + 'ea' mixes an initial with a prefix ('to eat')
+    assert fuzzy_score("tea", "cheese pizza (large) ready-to-eat") == -1
+    # Short prefixes must be the whole word
+    assert fuzzy_score("pea", "peanut butter protein") == -1
+    assert fuzzy_score("", "peanut butter protein") == -1
+
+
+def test_fuzzy_find_prefers_whole_word_matches() -> None:
+    """The best-scoring item wins rather than the first candidate that matches."""
+    match = fuzzy_find("sauce")
+    assert match is not None
+    assert match.name == "Tomato Sauce"
+
+
+def test_normalize_strips_punctuation_and_whitespace() -> None:
+    """Sentence punctuation and extra whitespace are dropped; plurals are kept."""
+    assert _normalize("  Milk?  ") == "milk"
+    assert _normalize("Eggs!") == "eggs"
+    assert _normalize("peanut   butter.") == "peanut butter"
+    assert _normalize("Tomatoes") == "tomatoes"
+
+
+@pytest.mark.parametrize(
+    ("pattern", "expected"),
+    [
+        ("milk?", "milk (gallon)"),
+        ("eggs!", "eggs (dozen)"),
+        ("Peanut Butter.", "peanut butter"),
+        ("peanut butters", "peanut butter"),
+    ],
+)
+def test_resolves_punctuated_and_plural_names(pattern: str, expected: str) -> None:
+    """Punctuation is ignored and the de-pluralised form is tried as a fallback."""
+    assert _resolve_item(pattern) == expected
+
+
+def test_find_phrase_picks_the_longest_name_in_an_utterance() -> None:
+    """A catalog name spoken inside a longer phrase is found; unknown text is not."""
+    match = find_phrase("two jars of tomato sauce please")
+    assert match is not None
+    assert match.name == "Tomato Sauce"
+    assert find_phrase("something else entirely") is None
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        "vegan cheese",
+        "dairy free milk",
+        "protein bar",
+        "sea salt",
+        "breakfast sausage",
+        "meat sauce",
+        "hot sauce",
+    ],
+)
+def test_tag_inside_a_longer_phrase_does_not_resolve(pattern: str) -> None:
+    """A tag word within a longer request describes something else, not a catalog item."""
+    assert find_phrase(pattern) is None
+    assert _resolve_item(pattern) is None
+
+
+@pytest.mark.parametrize(
+    ("request_text", "expected"),
+    [
+        ("ingredients for pasta for two", "pasta for two"),
+        ("ingredients for a peanut butter sandwich", "peanut butter sandwich"),
+        ("Ingredients for the basic breakfast", "basic breakfast"),
+        ("ingredients for spaghetti pasta for two", "pasta for two"),
+        ("the basic breakfast", "basic breakfast"),
+    ],
+)
+def test_resolve_recipe(request_text: str, expected: str) -> None:
+    """Recipes are found through the prefix, leading articles and, with the prefix, extra words."""
+    assert resolve_recipe(request_text) == expected
+
+
+@pytest.mark.parametrize(
+    "request_text",
+    [
+        "ingredients for lasagna",
+        "peanut butter",
+        "basic breakfast cereal",
+        "spaghetti pasta for two",
+    ],
+)
+def test_resolve_recipe_rejects_unknown_recipes_and_items(request_text: str) -> None:
+    """Unknown recipes and item requests that merely contain a recipe name are not recipes."""
+    assert resolve_recipe(request_text) is None
+
+
+def test_recipe_suggestion_names_only_missing_ingredients() -> None:
+    """Suggestions list what the cart still lacks and stop once the recipe is complete."""
+    state = OrderingState()
+    state.add_item(CATALOG["spaghetti pasta"], 1)
+    suggestion = recipe_suggestion(state, "spaghetti pasta")
+    assert "pasta for two" in suggestion
+    assert "Tomato Sauce" in suggestion
+    assert "Spaghetti Pasta" not in suggestion
+
+    state.add_item(CATALOG["tomato sauce"], 1)
+    assert recipe_suggestion(state, "tomato sauce") == ""
+    assert recipe_suggestion(state, "cheese pizza (large)") == ""
+
+
+def test_cart_total_tracks_add_item_and_clear_cart() -> None:
+    """Adding merges quantities into one line and the running total follows."""
+    milk = CATALOG["milk (gallon)"]
+    sauce = CATALOG["tomato sauce"]
+    state = OrderingState()
+    state.add_item(milk, 2)
+    state.add_item(milk, 1, notes="ignored on merge")
+    state.add_item(sauce, 1)
+
+    assert list(state.cart) == ["milk (gallon)", "tomato sauce"]
+    assert state.cart["milk (gallon)"].quantity == 3
+    assert state.calculate_total() == pytest.approx(3 * milk.price + sauce.price)
+
+    state.clear_cart()
+    assert state.cart == {}
+    assert state.calculate_total() == 0.0